@@ -29,6 +29,7 @@ def main():
     print(f"  输出: {OUTPUT_FILE}")
     print()
 
+    downloaded = []
     try:
         copernicusmarine.subset(
             dataset_id="cmems_mod_glo_phy-cur_anfc_0.083deg_PT6H-i",
@@ -45,6 +46,7 @@ def main():
             output_directory=str(OUTPUT_DIR),
         )
         print("海流数据下载完成!")
+        downloaded.append(OUTPUT_DIR / "cmems_currents.nc")
     except Exception as e:
         print(f"海流下载失败: {e}")
         print("提示: 确保已登录 CMEMS，运行: copernicusmarine login")
@@ -66,9 +68,14 @@ def main():
             output_directory=str(OUTPUT_DIR),
         )
         print("海温数据下载完成!")
+        downloaded.append(OUTPUT_DIR / "cmems_sst.nc")
     except Exception as e:
         print(f"海温下载失败: {e}")
 
+    from preprocess import try_convert_to_zarr
+    for nc_file in downloaded:
+        try_convert_to_zarr(nc_file)
+
 
 if __name__ == "__main__":
     main()
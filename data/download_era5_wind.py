@@ -74,6 +74,9 @@ def main():
     print(f"ERA5 风场数据下载完成: {OUTPUT_FILE}")
     print(f"文件大小: {OUTPUT_FILE.stat().st_size / 1024:.0f} KB")
 
+    from preprocess import try_convert_to_zarr
+    try_convert_to_zarr(OUTPUT_FILE)
+
 
 if __name__ == "__main__":
     main()
@@ -1,43 +1,142 @@
 #!/usr/bin/env python3
 """
-预处理脚本: 将下载的 NetCDF 数据转换为紧凑 JSON 网格格式
+预处理脚本: 将下载的 NetCDF 数据转换为 JSON 头 + 二进制变量数据
 供前端 JavaScript 直接使用
 
 输入: data/raw/*.nc
-输出: data/processed/*.json
+输出: data/processed/{name}_grid.json (+ 预压缩 .json.gz，供服务器直接发送)
+      data/processed/{name}_{var}.i16  (时变场: 坐标头 + little-endian int16 量化数组)
+      data/processed/{name}_{var}.i8   (陆海掩膜: 坐标头 + int8 定点数组，value = q / 127)
 
-JSON 格式:
+JSON 头格式:
 {
-  "lat": [36.0, 36.083, ...],          # 升序纬度数组
-  "lon": [118.0, 118.083, ...],        # 升序经度数组
-  "time_hours": [0, 1, 2, ..., 48],    # 自起始时刻的小时数 (仅时变场)
   "shape": [nTime, nLat, nLon],        # 数据维度
-  "varName": [v1, v2, ...],            # 展平的 row-major 数组
+  "vars": ["u10", "v10"],              # 变量列表
+  "header_bytes": 508,                 # 变量文件中坐标头的字节数
+  "time_chunks": true,                 # 可按时间步 Range 请求渐进加载 (仅时变场)
+  "encoding": {                        # 各变量的存储类型与量化参数
+    "u10": {"dtype": "i2", "scale": 2521.5, "offset": 0.42},
+  },
 }
 
+变量文件 (little-endian):
+  [magic u32 = 0xCAFE][nt u32][nlat u32][nlon u32]   # 静态场 nt = 0
+  [lat f32 × nlat][lon f32 × nlon][time_hours f32 × nt]  # 升序纬度/经度，自起始时刻的小时数
+  [data × max(nt, 1) × nlat × nlon]                  # 展平的 row-major 数组
+
+整型还原: value = q / scale + offset
 索引方式: data[t * nLat * nLon + lat_i * nLon + lon_i]
 """
 
-import json
+import contextlib
+import gzip
+import io
+import os
+import shutil
+import struct
 import sys
+import warnings
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 import numpy as np
+import orjson
+
+try:
+    import numba
+    from numba import njit, prange
+except ImportError:  # numba 为可选加速依赖，缺失时退回 numpy 实现
+    njit = None
 
 RAW_DIR = Path(__file__).parent / "raw"
 OUT_DIR = Path(__file__).parent / "processed"
 OUT_DIR.mkdir(exist_ok=True)
 
-DECIMALS = 3  # 数值精度（小数位）
+GZIP_LEVEL = 9  # 预压缩级别（一次性成本，取最高压缩比）
+TIME_DIMS = ('time', 'valid_time')  # CMEMS / ERA5 的时间维命名
+TIME_CHUNK = 24  # dask 分块: 每块 24 个时间步
+MAX_WORKERS = 4  # 预处理并行进程数上限（每个数据集一个任务）
+INT16_LIMIT = 32760  # int16 量化满量程（略小于 32767，留出舍入余量）
+INT8_SCALE = 127.0  # [0, 1] 比例场的 int8 定点倍数（用满 int8 正值范围，误差 ≤ 0.5/127 ≈ 0.004）
+GRID_MAGIC = 0xCAFE  # 变量文件坐标头的魔数
 
+# 每个进程可用的计算线程数（dask 调度器 + numba 内核）；多进程时由 _init_worker 按进程数均分
+_threads = os.cpu_count() or 1
 
-def load_dataset(filepath):
-    """加载 NetCDF 文件"""
+# 二进制存储类型 → 文件扩展名
+DTYPE_EXT = {'f4': 'f32', 'i2': 'i16', 'i1': 'i8'}
+
+
+def hdf5_chunks(da):
+    """按文件内部 HDF5 分块确定 dask 分块，使每个 HDF5 块只被一个任务读取/解压
+
+    时间维取 HDF5 块大小不小于 TIME_CHUNK 的整数倍（避免逐步小任务），其余维与 HDF5 块一致；
+    无分块（连续存储）的变量仅按时间维分块。
+    """
+    chunksizes = da.encoding.get("chunksizes")
+    if not chunksizes:
+        return {dim: TIME_CHUNK for dim in TIME_DIMS if dim in da.dims}
+    chunks = {}
+    for dim, size in zip(da.dims, chunksizes):
+        if dim in TIME_DIMS:
+            size *= -(-TIME_CHUNK // size)
+        chunks[dim] = size
+    return chunks
+
+
+def open_netcdf(filepath):
+    """打开 NetCDF 文件（h5netcdf 引擎，按 HDF5 分块对齐为 dask 数组，延迟读取）"""
     import xarray as xr
-    ds = xr.open_dataset(filepath)
+    ds = xr.open_dataset(filepath, engine="h5netcdf")
+    for name, da in ds.data_vars.items():
+        ds[name] = da.chunk(hdf5_chunks(da))
     return ds
 
 
+def convert_to_zarr(nc_file):
+    """将 NetCDF 转存为同名 .zarr 目录（各分块独立压缩，可多线程并发解码）"""
+    nc_file = Path(nc_file)
+    zarr_path = nc_file.with_suffix(".zarr")
+    tmp_path = nc_file.with_suffix(".zarr.tmp")
+    with open_netcdf(nc_file) as ds:
+        for var in ds.variables.values():
+            var.encoding = {}  # 丢弃 NetCDF 专有编码参数，由 zarr 重新分块压缩
+        ds.to_zarr(tmp_path, mode="w", consolidated=False)
+    # 写完再替换，避免中断后留下不完整的 .zarr
+    shutil.rmtree(zarr_path, ignore_errors=True)
+    tmp_path.rename(zarr_path)
+    return zarr_path
+
+
+def try_convert_to_zarr(nc_file):
+    """下载脚本用: 转存为 Zarr，失败只提示不中断（预处理时会直接读取 NetCDF）"""
+    try:
+        zarr_path = convert_to_zarr(nc_file)
+    except Exception as e:
+        print(f"Zarr 转换未完成 ({Path(nc_file).name}): {e}")
+        print("提示: 数据已下载，preprocess.py 将直接读取 NetCDF")
+        return None
+    print(f"已转换为 Zarr: {zarr_path}")
+    return zarr_path
+
+
+def load_dataset(filepath):
+    """加载数据集: 存在不旧于 NetCDF 的同名 .zarr 时读取 Zarr，否则直接读取 NetCDF"""
+    import xarray as xr
+    zarr_path = filepath.with_suffix(".zarr")
+    if zarr_path.exists() and zarr_path.stat().st_mtime >= filepath.stat().st_mtime:
+        return xr.open_zarr(zarr_path, consolidated=False)
+    return open_netcdf(filepath)
+
+
+def compute_array(da):
+    """在 dask 线程调度器上并行解压/计算变量，返回 numpy 数组"""
+    data = da.data
+    if hasattr(data, "compute"):
+        return data.compute(scheduler="threads", num_workers=_threads)
+    return np.asarray(data)
+
+
 def get_coords(ds):
     """提取纬度和经度坐标（统一处理不同命名）"""
     # 纬度
@@ -65,29 +164,104 @@ def get_coords(ds):
 
 def extract_variable(ds, var_name, lat_ascending, squeeze_depth=True):
     """提取变量数据，处理深度维度和排序"""
-    arr = ds[var_name].values
+    da = ds[var_name]
 
-    # 如果有深度维度，取表层
+    # 如果有深度维度，在延迟数组上先取表层，只读取/解压表层分块
     if squeeze_depth:
         # 检查是否有 depth 维度
         for dim_name in ['depth', 'level', 'z']:
-            if dim_name in ds[var_name].dims:
+            if dim_name in da.dims:
                 # 取第一个深度层（表层）
-                depth_idx = list(ds[var_name].dims).index(dim_name)
-                arr = np.take(arr, 0, axis=depth_idx)
+                da = da.isel({dim_name: 0})
                 break
 
+    arr = compute_array(da)
+
     # 如果纬度降序，翻转
     if not lat_ascending:
         lat_dim = -2  # 倒数第二个维度是 lat
         arr = np.flip(arr, axis=lat_dim)
 
-    # 替换 NaN
-    arr = np.nan_to_num(arr, nan=0.0)
-
+    # NaN 保留，在量化时与舍入一并替换（单次遍历）
     return arr
 
 
+def write_grid(out_file, result):
+    """输出紧凑 JSON（orjson 直接序列化 numpy 数组），并同时写出预压缩的 .json.gz"""
+    payload = orjson.dumps(result, option=orjson.OPT_SERIALIZE_NUMPY)
+    with gzip.open(out_file.with_suffix('.json.gz'), 'wb', compresslevel=GZIP_LEVEL) as gz:
+        gz.write(payload)
+    # 最后写 .json: 服务器按其 mtime 判断头是否更新，此时变量文件与 .json.gz 均已写完
+    out_file.write_bytes(payload)
+
+
+if njit is not None:
+    @njit(parallel=True, cache=True)
+    def _quantize_kernel(x, fill, offset, scale, out):
+        """NaN 替换 + 平移缩放 + 舍入 + int16 转换，融合为一次并行遍历（x 可为非连续的三维视图）"""
+        for t in prange(x.shape[0]):
+            for i in range(x.shape[1]):
+                for j in range(x.shape[2]):
+                    v = x[t, i, j]
+                    if np.isnan(v):
+                        v = fill
+                    out[t, i, j] = np.int16(np.rint((v - offset) * scale))
+
+
+def quantize_int16(arr, fill=0.0):
+    """按变量值域线性量化为 int16（NaN 视为 fill），返回 (量化数组, scale, offset)
+
+    值域取有效值的 nanmin/nanmax 并始终纳入 fill；全为 NaN 时整个场取 fill。
+    """
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # 全 NaN 切片的警告，下面单独处理
+        lo, hi = float(np.nanmin(arr)), float(np.nanmax(arr))
+    if np.isnan(lo):
+        print(f"    警告: 变量全为 NaN，以 {fill} 填充")
+        lo = hi = fill
+    lo, hi = min(lo, fill), max(hi, fill)
+    offset = (lo + hi) / 2
+    half_range = (hi - lo) / 2
+    scale = INT16_LIMIT / half_range if half_range > 0 else 1.0
+
+    if njit is not None:
+        x = arr.reshape((-1,) + arr.shape[-2:])  # 纬度翻转后的视图直接传入，不复制
+        q = np.empty(x.shape, dtype='<i2')
+        _quantize_kernel(x, fill, offset, scale, q)
+    else:
+        filled = np.where(np.isnan(arr), fill, arr)
+        q = np.rint((filled - offset) * scale).astype('<i2')
+    return q, scale, offset
+
+
+def coords_header(lat, lon, time_hours=None):
+    """打包变量文件的二进制坐标头（维度 + float32 坐标数组），静态场 nt = 0"""
+    if time_hours is None:
+        time_hours = np.empty(0)
+    dims = struct.pack('<IIII', GRID_MAGIC, len(time_hours), len(lat), len(lon))
+    return dims + b''.join(np.asarray(a, dtype='<f4').tobytes() for a in (lat, lon, time_hours))
+
+
+def write_variable(output_name, var, arr, header, dtype='f4', fill=0.0):
+    """将坐标头与变量数组写为 little-endian 二进制文件，返回 (文件路径, 编码信息)"""
+    ext = DTYPE_EXT[dtype]
+    out_file = OUT_DIR / f"{output_name}_{var}.{ext}"
+    if dtype == 'i2':
+        data, scale, offset = quantize_int16(arr, fill)
+        encoding = {"dtype": dtype, "scale": scale, "offset": offset}
+    elif dtype == 'i1':
+        data = np.nan_to_num(arr, nan=fill) * INT8_SCALE
+        data = np.rint(data, out=data).astype('<i1')
+        encoding = {"dtype": dtype, "scale": INT8_SCALE, "offset": 0.0}
+    else:
+        data = np.nan_to_num(arr, nan=fill).astype('<f4')
+        encoding = {"dtype": dtype}
+    with open(out_file, 'wb') as f:
+        f.write(header)
+        data.tofile(f)
+    return out_file, encoding
+
+
 def process_time_varying(nc_file, var_names, output_name):
     """处理时变场（海流、风、海温）"""
     print(f"  加载 {nc_file.name} ...")
@@ -100,7 +274,7 @@ def process_time_varying(nc_file, var_names, output_name):
 
     # 提取时间
     time_dim = None
-    for name in ['time', 'valid_time']:
+    for name in TIME_DIMS:
         if name in ds.dims:
             time_dim = name
             break
@@ -112,11 +286,13 @@ def process_time_varying(nc_file, var_names, output_name):
     time_values = ds[time_dim].values
     time_hours = ((time_values - t0) / np.timedelta64(1, 'h')).astype(float)
 
+    header = coords_header(np.round(lat, 4), np.round(lon, 4), np.round(time_hours, 2))
     result = {
-        "lat": np.round(lat, 4).tolist(),
-        "lon": np.round(lon, 4).tolist(),
-        "time_hours": [round(float(t), 2) for t in time_hours],
         "shape": [len(time_hours), len(lat), len(lon)],
+        "vars": [],
+        "header_bytes": len(header),
+        "time_chunks": True,
+        "encoding": {},
     }
 
     for var in var_names:
@@ -127,12 +303,14 @@ def process_time_varying(nc_file, var_names, output_name):
         # 确保是 3D (time, lat, lon)
         if arr.ndim == 2:
             arr = arr[np.newaxis, :, :]
-        result[var] = np.round(arr, DECIMALS).flatten().tolist()
-        print(f"    {var}: shape={arr.shape}, range=[{arr.min():.3f}, {arr.max():.3f}]")
+        var_file, encoding = write_variable(output_name, var, arr, header, dtype='i2')
+        result["vars"].append(var)
+        result["encoding"][var] = encoding
+        print(f"    {var}: shape={arr.shape}, range=[{np.nanmin(arr):.3f}, {np.nanmax(arr):.3f}], "
+              f"输出: {var_file.name}")
 
     out_file = OUT_DIR / f"{output_name}_grid.json"
-    with open(out_file, 'w') as f:
-        json.dump(result, f, separators=(',', ':'))
+    write_grid(out_file, result)
 
     size_kb = out_file.stat().st_size / 1024
     print(f"    输出: {out_file.name} ({size_kb:.0f} KB)")
@@ -161,7 +339,7 @@ def process_landmask(nc_file):
         lsm_var = list(ds.data_vars)[0]
         print(f"    使用变量: {lsm_var}")
 
-    arr = ds[lsm_var].values
+    arr = compute_array(ds[lsm_var])
     if not lat_asc:
         arr = np.flip(arr, axis=-2)
 
@@ -171,24 +349,66 @@ def process_landmask(nc_file):
 
     arr = np.nan_to_num(arr, nan=1.0)  # NaN 视为陆地
 
+    header = coords_header(np.round(lat, 4), np.round(lon, 4))
     result = {
-        "lat": np.round(lat, 4).tolist(),
-        "lon": np.round(lon, 4).tolist(),
         "shape": [len(lat), len(lon)],
-        "lsm": np.round(arr, DECIMALS).flatten().tolist(),
+        "vars": ["lsm"],
+        "header_bytes": len(header),
     }
+    _, encoding = write_variable("landmask", "lsm", arr, header, dtype='i1')
+    result["encoding"] = {"lsm": encoding}
 
     out_file = OUT_DIR / "landmask_grid.json"
-    with open(out_file, 'w') as f:
-        json.dump(result, f, separators=(',', ':'))
+    write_grid(out_file, result)
 
-    land_pct = (arr > 0.5).mean() * 100
+    land_pct = np.count_nonzero(arr > 0.5) * 100.0 / arr.size
     size_kb = out_file.stat().st_size / 1024
     print(f"    lsm: shape={arr.shape}, 陆地比例={land_pct:.1f}%")
     print(f"    输出: {out_file.name} ({size_kb:.0f} KB)")
     ds.close()
 
 
+def _init_worker(threads):
+    """进程池初始化: 限定本进程的计算线程数，避免多进程 × 多线程超额占用 CPU"""
+    global _threads
+    _threads = threads
+    if njit is not None:
+        numba.set_num_threads(min(threads, numba.config.NUMBA_NUM_THREADS))
+
+
+class _LinePrefixer(io.TextIOBase):
+    """逐行加前缀后写入目标流，区分并行任务交错输出的各行归属"""
+
+    def __init__(self, prefix, stream):
+        self._prefix = prefix
+        self._stream = stream
+        self._pending = ""
+
+    def write(self, text):
+        *lines, self._pending = (self._pending + text).split("\n")
+        for line in lines:
+            self._stream.write(f"{self._prefix}{line}\n")
+        self._stream.flush()
+        return len(text)
+
+    def flush(self):
+        if self._pending:
+            self._stream.write(f"{self._prefix}{self._pending}\n")
+            self._pending = ""
+        self._stream.flush()
+
+
+def _dispatch(task):
+    """进程池入口: 解包 (进度, 标签, 函数, 参数...) 并执行，输出逐行标注数据集标签"""
+    progress, label, func, *args = task
+    print(f"{progress} 开始处理 {label}...", flush=True)
+    out = _LinePrefixer(f"[{label}] ", sys.stdout)
+    with contextlib.redirect_stdout(out):
+        result = func(*args)
+    out.flush()
+    return result
+
+
 def main():
     try:
         import xarray  # noqa
@@ -197,46 +417,36 @@ def main():
         sys.exit(1)
 
     print("=" * 50)
-    print("NetCDF → JSON 网格数据预处理")
+    print("NetCDF → JSON + 二进制网格数据预处理")
     print("=" * 50)
 
-    # 1. CMEMS 海流
-    cmems_cur = RAW_DIR / "cmems_currents.nc"
-    if cmems_cur.exists():
-        print("\n[1/4] 处理 CMEMS 海流数据...")
-        process_time_varying(cmems_cur, ["uo", "vo"], "current")
-    else:
-        print(f"\n[1/4] 跳过: {cmems_cur} 不存在")
-
-    # 2. CMEMS 海温
-    cmems_sst = RAW_DIR / "cmems_sst.nc"
-    if cmems_sst.exists():
-        print("\n[2/4] 处理 CMEMS 海温数据...")
-        process_time_varying(cmems_sst, ["thetao"], "temperature")
-    else:
-        print(f"\n[2/4] 跳过: {cmems_sst} 不存在")
-
-    # 3. ERA5 风场
-    era5_wind = RAW_DIR / "era5_wind.nc"
-    if era5_wind.exists():
-        print("\n[3/4] 处理 ERA5 风场数据...")
-        process_time_varying(era5_wind, ["u10", "v10"], "wind")
-    else:
-        print(f"\n[3/4] 跳过: {era5_wind} 不存在")
-
-    # 4. 陆海掩膜
-    landmask = RAW_DIR / "era5_landmask.nc"
-    if landmask.exists():
-        print("\n[4/4] 处理陆海掩膜...")
-        process_landmask(landmask)
-    else:
-        print(f"\n[4/4] 跳过: {landmask} 不存在")
+    # 各数据集相互独立，分发到多进程并行处理
+    jobs = [
+        ("CMEMS 海流数据", RAW_DIR / "cmems_currents.nc", process_time_varying, ["uo", "vo"], "current"),
+        ("CMEMS 海温数据", RAW_DIR / "cmems_sst.nc", process_time_varying, ["thetao"], "temperature"),
+        ("ERA5 风场数据", RAW_DIR / "era5_wind.nc", process_time_varying, ["u10", "v10"], "wind"),
+        ("陆海掩膜", RAW_DIR / "era5_landmask.nc", process_landmask),
+    ]
+    tasks = []
+    for i, (label, nc_file, func, *args) in enumerate(jobs, 1):
+        progress = f"[{i}/{len(jobs)}]"
+        if nc_file.exists():
+            tasks.append((progress, label, func, nc_file, *args))
+        else:
+            print(f"{progress} 跳过: {nc_file} 不存在")
+    print()
+
+    if tasks:
+        workers = min(MAX_WORKERS, len(tasks), os.cpu_count() or 1)
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(threads,)) as ex:
+            list(ex.map(_dispatch, tasks))
 
     # 汇总
     print("\n" + "=" * 50)
     print("处理完成。生成的文件:")
     total_size = 0
-    for f in sorted(OUT_DIR.glob("*.json")):
+    for f in sorted(p for p in OUT_DIR.iterdir() if p.is_file()):
         size = f.stat().st_size / 1024
         total_size += size
         print(f"  {f.name}: {size:.0f} KB")
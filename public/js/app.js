@@ -117,6 +117,179 @@
     return gridLoadingPromise;
   }
 
+  // 二进制存储类型 → [文件扩展名, TypedArray]
+  const GRID_DTYPES = {
+    f4: ['f32', Float32Array],
+    i2: ['i16', Int16Array],
+    i1: ['i8', Int8Array],
+  };
+
+  const GRID_MAGIC = 0xCAFE;  // 变量文件坐标头魔数
+  const GRID_RETRY_LIMIT = 3;  // 后台加载失败后的重试次数（每次从已加载位置续传）
+  const GRID_RETRY_DELAY = 2000;  // 重试间隔基数 (ms)，按次数线性递增
+  const GRID_RANGE_BYTES = 4_000_000;  // 后台单次 Range 请求的字节上限（低于服务器 GRID_MAX_BYTES）
+
+  /**
+   * 网格请求失败时的错误（保留 HTTP 状态码，429 单独提示限流）
+   */
+  function responseError(url, r) {
+    const err = new Error(r.status === 429 ? `${url}: 请求过于频繁 (HTTP 429)` : `${url}: HTTP ${r.status}`);
+    err.status = r.status;
+    return err;
+  }
+
+  /**
+   * 拉取变量文件的一段字节（range 为 [start, end] 闭区间，省略则取整个文件）
+   * 服务器未按 Range 响应 (200) 时从完整内容中截取
+   */
+  async function fetchBytes(url, range) {
+    const headers = range ? { Range: `bytes=${range[0]}-${range[1]}` } : {};
+    const r = await fetch(url, { headers });
+    if (!r.ok) throw responseError(url, r);
+    const buf = await r.arrayBuffer();
+    return range && r.status !== 206 ? buf.slice(range[0], range[1] + 1) : buf;
+  }
+
+  /**
+   * 以 Range 请求 (bytes=start-end) 流式读取变量文件的一段，
+   * 每凑满一个时间步 (stepBytes 字节) 即回调 onStep(ArrayBuffer)
+   */
+  async function streamSteps(url, start, end, stepBytes, onStep) {
+    const r = await fetch(url, { headers: { Range: `bytes=${start}-${end}` } });
+    if (!r.ok) throw responseError(url, r);
+    let skip = r.status === 206 ? 0 : start;  // 服务器忽略 Range 时跳过已加载部分
+    let remaining = end - start + 1;
+    const step = new Uint8Array(stepBytes);
+    let filled = 0;
+    const reader = r.body.getReader();
+    while (remaining > 0) {
+      const { done, value } = await reader.read();
+      if (done) return;
+      let chunk = value;
+      if (skip > 0) {
+        const n = Math.min(skip, chunk.length);
+        chunk = chunk.subarray(n);
+        skip -= n;
+      }
+      chunk = chunk.subarray(0, remaining);
+      remaining -= chunk.length;
+      while (chunk.length > 0) {
+        const n = Math.min(stepBytes - filled, chunk.length);
+        step.set(chunk.subarray(0, n), filled);
+        filled += n;
+        chunk = chunk.subarray(n);
+        if (filled === stepBytes) {
+          onStep(step.buffer);
+          filled = 0;
+        }
+      }
+    }
+    reader.cancel();
+  }
+
+  /**
+   * 解析变量文件开头的坐标头: [magic][nt][nlat][nlon] (u32) + lat/lon/time_hours (f32)
+   */
+  function parseCoordsHeader(buf) {
+    const view = new DataView(buf);
+    if (view.getUint32(0, true) !== GRID_MAGIC) throw new Error('网格坐标头格式错误');
+    const [nT, nLat, nLon] = [4, 8, 12].map(p => view.getUint32(p, true));
+    const coords = new Float32Array(buf, 16, nLat + nLon + nT);
+    return {
+      lat: Array.from(coords.subarray(0, nLat)),
+      lon: Array.from(coords.subarray(nLat, nLat + nLon)),
+      time_hours: nT > 0 ? Array.from(coords.subarray(nLat + nLon)) : undefined,
+    };
+  }
+
+  /**
+   * 将二进制数据解码为 float32（整型量化值按 value = q / scale + offset 还原）
+   * 传入 out 时写入 out[offset...]，否则返回新数组
+   */
+  function decodeVarData(buf, byteOffset, enc, out, offset = 0) {
+    const ArrayType = GRID_DTYPES[enc.dtype][1];
+    const raw = new ArrayType(buf, byteOffset, (buf.byteLength - byteOffset) / ArrayType.BYTES_PER_ELEMENT);
+
+    if (ArrayType === Float32Array) {
+      if (!out) return raw;
+      out.set(raw, offset);
+      return out;
+    }
+    if (!out) out = new Float32Array(raw.length);
+    const inv = 1 / enc.scale;
+    for (let i = 0; i < raw.length; i++) {
+      out[offset + i] = raw[i] * inv + enc.offset;
+    }
+    return out;
+  }
+
+  /**
+   * 加载单个网格：先取 JSON 头，再拉取各变量的二进制文件（坐标取自文件头）
+   * 时变场先以 Range 请求取坐标头 + 首个时间步即返回，其余时间步在后台以流式 Range 请求按顺序补齐
+   */
+  async function fetchGrid(name) {
+    const r = await fetch(`/api/grid/${name}`);
+    if (!r.ok) throw responseError(`/api/grid/${name}`, r);
+    const json = await r.json();
+    if (!json.vars) return new FieldGrid(json);  // 旧版内联 JSON 格式
+
+    const encoding = json.encoding || {};
+    const encOf = v => encoding[v] || { dtype: 'f4' };
+    const urlOf = v => `/api/grid/${name}/${v}.${GRID_DTYPES[encOf(v).dtype][0]}`;
+    const hdr = json.header_bytes;
+
+    if (!json.time_chunks) {
+      const bufs = await Promise.all(json.vars.map(v => fetchBytes(urlOf(v))));
+      const data = {};
+      json.vars.forEach((v, i) => { data[v] = decodeVarData(bufs[i], hdr, encOf(v)); });
+      return new FieldGrid({ ...json, ...parseCoordsHeader(bufs[0]) }, data);
+    }
+
+    const [nT, nLat, nLon] = json.shape;
+    const sliceSize = nLat * nLon;
+    const sliceBytes = v => sliceSize * GRID_DTYPES[encOf(v).dtype][1].BYTES_PER_ELEMENT;
+    const data = {};
+    json.vars.forEach(v => { data[v] = new Float32Array(nT * sliceSize); });
+
+    // 首个请求连同坐标头一起取回
+    const first = await Promise.all(json.vars.map(v => fetchBytes(urlOf(v), [0, hdr + sliceBytes(v) - 1])));
+    json.vars.forEach((v, i) => decodeVarData(first[i], hdr, encOf(v), data[v], 0));
+    const grid = new FieldGrid({ ...json, ...parseCoordsHeader(first[0]) }, data);
+    grid.loadedSteps = 1;
+
+    // 各变量已加载的时间步数；网格可用步数取所有变量中的最小值
+    const steps = {};
+    json.vars.forEach(v => { steps[v] = 1; });
+
+    // 剩余时间步按不超过 GRID_RANGE_BYTES 的整步 Range 分段请求（通常一段即可取完）
+    const loadRest = async v => {
+      const stepsPerRange = Math.max(1, Math.floor(GRID_RANGE_BYTES / sliceBytes(v)));
+      let attempt = 1;
+      while (steps[v] < nT) {
+        const start = hdr + steps[v] * sliceBytes(v);
+        const target = Math.min(nT, steps[v] + stepsPerRange);
+        const end = hdr + target * sliceBytes(v) - 1;
+        try {
+          await streamSteps(urlOf(v), start, end, sliceBytes(v), buf => {
+            decodeVarData(buf, 0, encOf(v), data[v], steps[v] * sliceSize);
+            steps[v]++;
+            grid.loadedSteps = Math.min(...Object.values(steps));
+          });
+          if (steps[v] < target) throw new Error(`${urlOf(v)}: 数据不完整 (${steps[v]}/${nT})`);
+        } catch (err) {
+          // 仅网络中断、数据截断与限流 (429) 可重试，其余 HTTP 错误重试也不会成功
+          if (attempt > GRID_RETRY_LIMIT || (err.status && err.status !== 429)) throw err;
+          console.warn(`[Grid] ${name}/${v} 加载中断，${attempt} 次重试:`, err.message);
+          await new Promise(resolve => setTimeout(resolve, GRID_RETRY_DELAY * attempt));
+          attempt++;
+        }
+      }
+    };
+
+    grid.ready = Promise.all(json.vars.map(loadRest));
+    return grid;
+  }
+
   async function _doLoadGridData() {
     try {
       // 先查询可用状态
@@ -128,7 +301,7 @@
 
       for (const [name, available] of Object.entries(status)) {
         if (available) {
-          loadTasks.push(fetch(`/api/grid/${name}`).then(r => r.json()));
+          loadTasks.push(fetchGrid(name));
           names.push(name);
         }
       }
@@ -142,7 +315,7 @@
       const results = await Promise.all(loadTasks);
 
       for (let i = 0; i < names.length; i++) {
-        const grid = new FieldGrid(results[i]);
+        const grid = results[i];
         switch (names[i]) {
           case 'wind':
             sim.windGrid = grid;
@@ -160,17 +333,31 @@
       }
 
       gridDataLoaded = true;
-      updateGridStatus('loaded', names);
+
+      // 首个时间步就绪即可开始模拟；剩余时间步全部到齐后才显示"已加载"
+      const pending = results.filter(g => g.ready);
+      if (pending.length === 0) {
+        updateGridStatus('loaded', names);
+      } else {
+        updateGridStatus('partial');
+        Promise.all(pending.map(g => g.ready)).then(() => {
+          updateGridStatus('loaded', names);
+          console.log('[Grid] 全部时间步已加载');
+        }, err => {
+          console.error('[Grid] 后台加载失败:', err);
+          updateGridStatus('error', '部分时间步加载失败，模拟将沿用最后可用时刻');
+        });
+      }
       console.log('[Grid] 网格数据已加载:', names.join(', '));
       return true;
     } catch (err) {
       console.error('[Grid] 加载失败:', err);
-      updateGridStatus('error');
+      updateGridStatus('error', err.status === 429 ? '请求过于频繁，请稍后再试' : undefined);
       return false;
     }
   }
 
-  function updateGridStatus(state, names) {
+  function updateGridStatus(state, detail) {
     if (!els.gridStatus) return;
     switch (state) {
       case 'loading':
@@ -178,11 +365,15 @@
         els.gridStatus.className = 'grid-status loading';
         break;
       case 'loaded':
-        els.gridStatus.textContent = '网格数据已加载 (' + names.join(', ') + ')';
+        els.gridStatus.textContent = '网格数据已加载 (' + detail.join(', ') + ')';
         els.gridStatus.className = 'grid-status loaded';
         break;
+      case 'partial':
+        els.gridStatus.textContent = '后续时刻加载中...';
+        els.gridStatus.className = 'grid-status loading';
+        break;
       case 'error':
-        els.gridStatus.textContent = '数据加载失败';
+        els.gridStatus.textContent = detail || '数据加载失败';
         els.gridStatus.className = 'grid-status error';
         break;
       case 'none':
@@ -70,22 +70,30 @@ const WIND_DEFLECTION = 15 * DEG_TO_RAD; // 风偏角 15°
 /**
  * 二维/三维网格场数据容器，支持双线性空间插值 + 线性时间插值
  *
- * JSON 格式:
+ * 网格头格式 (坐标由加载方从变量文件的二进制坐标头解析后并入):
  * {
  *   lat: [36.0, 36.1, ...],     // 升序纬度
  *   lon: [118.0, 118.1, ...],   // 升序经度
  *   time_hours: [0, 1, ...],    // 时间轴 (可选, 时变场才有)
  *   shape: [nT, nLat, nLon],    // 维度
- *   varName: [v1, v2, ...],     // 展平的 row-major 数组
+ *   vars: ['u10', 'v10'],       // 变量列表，数据以 Float32Array 另行传入
+ *   encoding: {...},            // 各变量存储类型/量化参数 (由加载方解码)
+ *   time_chunks: true,          // 可按时间步 Range 请求渐进加载 (可选)
  * }
  *
+ * 渐进加载时由加载方更新 loadedSteps（已就绪的前若干个时间步），
+ * 插值时间被限制在已加载范围内。
+ *
+ * 旧版 JSON 直接内联变量数组 (varName: [v1, v2, ...])，仍兼容。
+ *
  * 索引: data[t * nLat * nLon + latIdx * nLon + lonIdx]
  */
 class FieldGrid {
   /**
-   * @param {Object} json - 预处理后的 JSON 对象
+   * @param {Object} json - 预处理后的 JSON 头
+   * @param {Object<string, Float32Array>} [data] - 各变量的展平数组（二进制格式）
    */
-  constructor(json) {
+  constructor(json, data) {
     this.lat = json.lat;       // Float64Array-like
     this.lon = json.lon;
     this.nLat = this.lat.length;
@@ -105,15 +113,19 @@ class FieldGrid {
     this.timeHours = json.time_hours || null;
     this.nTime = this.timeHours ? this.timeHours.length : 0;
     this.isTimeVarying = this.nTime > 0;
+    this.loadedSteps = this.nTime;  // 已加载的时间步数（渐进加载时逐步增加）
 
     // 每个时间步的元素数
     this.sliceSize = this.nLat * this.nLon;
 
     // 存储各变量的 Float32Array
     this.vars = {};
-    const shape = json.shape;
+    if (data) {
+      Object.assign(this.vars, data);
+      return;
+    }
     for (const key of Object.keys(json)) {
-      if (['lat', 'lon', 'time_hours', 'shape'].includes(key)) continue;
+      if (['lat', 'lon', 'time_hours', 'shape', 'vars', 'encoding'].includes(key)) continue;
       const arr = json[key];
       if (Array.isArray(arr) && arr.length > 0) {
         this.vars[key] = new Float32Array(arr);
@@ -165,8 +177,9 @@ class FieldGrid {
     }
 
     // 时变场 — 时间线性插值 + 空间双线性插值
-    const th = timeHours || 0;
+    // 渐进加载未完成时，超出已加载范围的时刻保持最后一个已加载时间步
     const times = this.timeHours;
+    const th = Math.min(timeHours || 0, times[this.loadedSteps - 1]);
     let ft = 0;
     // 定位时间索引
     if (th <= times[0]) {
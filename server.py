@@ -1,48 +1,175 @@
 #!/usr/bin/env python3
 """海上溢油预测仿真系统 - HTTP 服务器"""
 
+import functools
 import gzip
+import hashlib
 import http.server
 import json
 import math
+import mmap
 import os
+import threading
+import time
 from pathlib import Path
 
+try:
+    import zstandard
+except ImportError:  # 可选依赖: 未安装时网格仅提供 gzip
+    zstandard = None
+
 PORT = 3000
 PUBLIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'public')
 DATA_DIR = Path(__file__).parent / 'data' / 'processed'
+GRID_NAMES = ('wind', 'current', 'temperature', 'landmask')
+GRID_VAR_EXTS = ('f32', 'i16', 'i8')  # 变量二进制格式: float32 原始值 / int16 量化值 / int8 定点值
 
-# ==================== 网格数据缓存 ====================
-_grid_cache = {}
+# 网格接口限流（按客户端 IP 的令牌桶）与响应体上限
+RATE_LIMIT_BURST = 60        # 桶容量: 允许的突发请求数
+RATE_LIMIT_PER_SEC = 1.0     # 令牌补充速率（个/秒）
+GRID_MAX_BYTES = 5_000_000   # 单个网格响应体上限，超出返回 503
+
+# 网格缓存与压缩
+ZSTD_LEVEL = 9               # zstd 压缩级别（加载时一次性压缩）
+GRID_CACHE_SIZE = 32         # 内存网格缓存条目上限（LRU 淘汰）
+
+ENV_TIME_BUCKET = 60         # /api/environment 时间分桶（秒），同一桶内复用缓存结果
 
+# 预设溢油场景
+SCENARIOS = [
+    {"id": 1, "name": "渤海湾溢油事故", "lat": 38.5, "lng": 119.0,
+     "oilVolume": 500, "oilType": "crude", "description": "渤海湾原油泄漏模拟场景"},
+    {"id": 2, "name": "南海平台泄漏", "lat": 19.5, "lng": 112.0,
+     "oilVolume": 1000, "oilType": "crude", "description": "南海钻井平台溢油模拟场景"},
+    {"id": 3, "name": "东海油轮事故", "lat": 30.0, "lng": 124.0,
+     "oilVolume": 2000, "oilType": "fuel", "description": "东海油轮碰撞溢油模拟场景"},
+    {"id": 4, "name": "管道持续泄漏", "lat": 37.8, "lng": 120.5,
+     "oilVolume": 800, "oilType": "crude", "spillMode": "continuous",
+     "spillDuration": 12, "description": "海底管道持续泄漏模拟场景（持续12小时）"},
+]
+_SCENARIOS_BYTES = json.dumps(SCENARIOS, ensure_ascii=False).encode('utf-8')  # 静态内容，导入时序列化一次
 
+# ==================== 网格数据缓存 ====================
 def _load_grid(name):
-    """加载预处理的 JSON 网格文件（缓存到内存）"""
-    if name not in _grid_cache:
-        filepath = DATA_DIR / f'{name}_grid.json'
-        if filepath.exists():
-            with open(filepath, 'r') as f:
-                _grid_cache[name] = f.read()
-            size_kb = filepath.stat().st_size / 1024
-            print(f'  已加载网格数据: {name} ({size_kb:.0f} KB)')
-        else:
-            _grid_cache[name] = None
-    return _grid_cache[name]
+    """取网格 JSON 头的缓存条目，文件不存在时返回 None
+
+    缓存按头文件的 mtime 区分: 重新运行 preprocess.py 后头文件随变量文件一起更新，
+    scale/offset 等量化参数与磁盘上的二进制数据保持一致。
+    """
+    try:
+        mtime_ns = (DATA_DIR / f'{name}_grid.json').stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+    return _load_grid_version(name, mtime_ns)
+
+
+@functools.lru_cache(maxsize=GRID_CACHE_SIZE)
+def _load_grid_version(name, mtime_ns):
+    """加载预处理的 JSON 网格文件及其压缩版本（以字节形式缓存到内存）
+
+    优先读取 preprocess.py 生成的 .json.gz；缺失时在加载时压缩一次。
+    安装了 zstandard 时另外预压缩一份 zstd。请求处理路径上不再做任何
+    编码/压缩。ETag 由原始内容的 MD5 预先算好。缓存按 LRU 限定条目数。
+    """
+    filepath = DATA_DIR / f'{name}_grid.json'
+    if not filepath.exists():
+        return None
+    raw = filepath.read_bytes()
+    gz_path = filepath.with_suffix('.json.gz')
+    if gz_path.exists():
+        gz = gz_path.read_bytes()
+    else:
+        gz = gzip.compress(raw, compresslevel=9)
+    zst = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(raw) if zstandard else None
+    etag = f'W/"{hashlib.md5(raw).hexdigest()}"'
+    print(f'  已加载网格数据: {name} ({len(raw) / 1024:.0f} KB, gzip {len(gz) / 1024:.0f} KB)')
+    return {'raw': raw, 'gz': gz, 'zst': zst, 'etag': etag}
+
+
+@functools.lru_cache(maxsize=1)
+def _grid_status_body():
+    """各网格数据的可用状态 JSON（数据文件在服务运行期间不变，只计算一次）"""
+    status = {name: (DATA_DIR / f'{name}_grid.json').exists() for name in GRID_NAMES}
+    return json.dumps(status).encode('utf-8')
 
 
 # 启动时预加载所有可用网格数据
 def _preload_grids():
     print('检查网格数据...')
     available = []
-    for name in ('wind', 'current', 'temperature', 'landmask'):
+    total_bytes = 0
+    for name in GRID_NAMES:
         data = _load_grid(name)
         if data:
             available.append(name)
+            total_bytes += len(data['raw'])
     if available:
-        total_kb = sum(len(_grid_cache[n]) for n in available if _grid_cache[n]) / 1024
-        print(f'  已加载: {", ".join(available)} (总计 {total_kb:.0f} KB)')
+        print(f'  已加载: {", ".join(available)} (总计 {total_bytes / 1024:.0f} KB)')
     else:
         print('  无网格数据，运行 data/preprocess.py 准备数据')
+    _grid_status_body()
+
+
+def _pick_encoding(accept_encoding, entry):
+    """按 Accept-Encoding 协商压缩格式: zstd → gzip → 不压缩（忽略 q=0 的项）"""
+    accepted = set()
+    for item in accept_encoding.split(','):
+        coding, _, params = item.partition(';')
+        param = params.strip()
+        if param.startswith('q='):
+            try:
+                if float(param[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(coding.strip().lower())
+    if entry['zst'] is not None and 'zstd' in accepted:
+        return 'zstd'
+    if 'gzip' in accepted or '*' in accepted:
+        return 'gzip'
+    return None
+
+
+def _opaque_tag(tag):
+    """去掉 ETag 的弱标记 W/ 前缀，用于 If-None-Match 的弱比较"""
+    tag = tag.strip()
+    return tag[2:] if tag.startswith('W/') else tag
+
+
+# ==================== 环境场 ====================
+@functools.lru_cache(maxsize=4096)
+def _environment_body(t_bucket):
+    """按时间桶计算模拟环境场（确定性函数，序列化结果直接缓存）"""
+    t = t_bucket * ENV_TIME_BUCKET
+    data = {
+        "wind": {"speed": 5 + 3 * math.sin(t * 0.001), "direction": (180 + 30 * math.sin(t * 0.0005)) % 360},
+        "current": {"speed": 0.3 + 0.15 * math.sin(t * 0.0008), "direction": (90 + 20 * math.cos(t * 0.0003)) % 360},
+        "temperature": 18 + 5 * math.sin(t * 0.0001),
+        "waveHeight": 0.5 + 0.3 * math.sin(t * 0.0006),
+    }
+    return json.dumps(data, ensure_ascii=False).encode('utf-8')
+
+
+# ==================== 限流 ====================
+_buckets = {}  # client ip -> (tokens, last_refill)
+_bucket_lock = threading.Lock()
+
+
+def _take_token(client_ip):
+    """令牌桶: 按流逝时间补充令牌后尝试消耗一个，令牌不足返回 False"""
+    now = time.monotonic()
+    with _bucket_lock:
+        tokens, last = _buckets.get(client_ip, (RATE_LIMIT_BURST, now))
+        tokens = min(RATE_LIMIT_BURST, tokens + (now - last) * RATE_LIMIT_PER_SEC)
+        allowed = tokens >= 1
+        _buckets[client_ip] = (tokens - 1 if allowed else tokens, now)
+
+        # 清理已回满的空闲桶，避免长期运行时字典无限增长
+        if len(_buckets) > 1024:
+            full_after = RATE_LIMIT_BURST / RATE_LIMIT_PER_SEC
+            for ip in [ip for ip, (_, t) in _buckets.items() if now - t > full_after]:
+                del _buckets[ip]
+    return allowed
 
 
 class SimulationHandler(http.server.SimpleHTTPRequestHandler):
@@ -62,78 +189,188 @@ class SimulationHandler(http.server.SimpleHTTPRequestHandler):
             super().do_GET()
 
     def _handle_scenarios(self):
-        scenarios = [
-            {"id": 1, "name": "渤海湾溢油事故", "lat": 38.5, "lng": 119.0,
-             "oilVolume": 500, "oilType": "crude", "description": "渤海湾原油泄漏模拟场景"},
-            {"id": 2, "name": "南海平台泄漏", "lat": 19.5, "lng": 112.0,
-             "oilVolume": 1000, "oilType": "crude", "description": "南海钻井平台溢油模拟场景"},
-            {"id": 3, "name": "东海油轮事故", "lat": 30.0, "lng": 124.0,
-             "oilVolume": 2000, "oilType": "fuel", "description": "东海油轮碰撞溢油模拟场景"},
-            {"id": 4, "name": "管道持续泄漏", "lat": 37.8, "lng": 120.5,
-             "oilVolume": 800, "oilType": "crude", "spillMode": "continuous",
-             "spillDuration": 12, "description": "海底管道持续泄漏模拟场景（持续12小时）"},
-        ]
-        self._json_response(scenarios)
+        self._json_bytes_response(_SCENARIOS_BYTES)
 
     def _handle_environment(self):
         from urllib.parse import urlparse, parse_qs
         params = parse_qs(urlparse(self.path).query)
-        t = float(params.get('time', [0])[0])
-        data = {
-            "wind": {"speed": 5 + 3 * math.sin(t * 0.001), "direction": (180 + 30 * math.sin(t * 0.0005)) % 360},
-            "current": {"speed": 0.3 + 0.15 * math.sin(t * 0.0008), "direction": (90 + 20 * math.cos(t * 0.0003)) % 360},
-            "temperature": 18 + 5 * math.sin(t * 0.0001),
-            "waveHeight": 0.5 + 0.3 * math.sin(t * 0.0006),
-        }
-        self._json_response(data)
+        try:
+            t = float(params.get('time', [0])[0])
+        except ValueError:
+            t = math.nan
+        if not math.isfinite(t):
+            self.send_error(400, 'Invalid time')
+            return
+        self._json_bytes_response(_environment_body(int(t // ENV_TIME_BUCKET)))
 
     def _handle_grid_status(self):
-        """返回各网格数据的可用状态"""
-        status = {}
-        for name in ('wind', 'current', 'temperature', 'landmask'):
-            filepath = DATA_DIR / f'{name}_grid.json'
-            status[name] = filepath.exists()
-        self._json_response(status)
+        """返回各网格数据的可用状态（启动时计算一次）"""
+        self._json_bytes_response(_grid_status_body())
 
     def _handle_grid(self):
-        """提供网格数据（支持 gzip 压缩）"""
-        name = self.path.split('/api/grid/')[-1].split('?')[0]
+        """提供网格数据（gzip 预压缩，直接发送缓存字节）"""
+        if not _take_token(self.client_address[0]):
+            self.send_error(429, 'Too Many Requests')
+            return
+
+        parts = self.path.split('/api/grid/')[-1].split('?')[0].split('/')
+        name = parts[0]
 
-        if name not in ('wind', 'current', 'temperature', 'landmask'):
+        if name not in GRID_NAMES or len(parts) > 2:
             self.send_error(404, f'Unknown grid: {name}')
             return
 
-        data = _load_grid(name)
-        if data is None:
+        if len(parts) == 2:
+            self._handle_grid_var(name, parts[1])
+            return
+
+        entry = _load_grid(name)
+        if entry is None:
             self.send_error(404, f'Grid data not available: {name}')
             return
 
+        if self._not_modified(entry['etag']):
+            return
+
+        if len(entry['raw']) > GRID_MAX_BYTES:
+            self.log_error('网格 %s 超出响应上限 (%d > %d 字节)', name, len(entry['raw']), GRID_MAX_BYTES)
+            self.send_error(503, f'Grid payload too large: {name}')
+            return
+
         self.send_response(200)
         self.send_header('Content-Type', 'application/json; charset=utf-8')
         self.send_header('Cache-Control', 'public, max-age=3600')
+        self.send_header('ETag', entry['etag'])
+        self.send_header('Vary', 'Accept-Encoding')
 
-        accept_encoding = self.headers.get('Accept-Encoding', '')
-        if 'gzip' in accept_encoding:
-            compressed = gzip.compress(data.encode('utf-8'))
+        encoding = _pick_encoding(self.headers.get('Accept-Encoding', ''), entry)
+        if encoding == 'zstd':
+            body = entry['zst']
+            self.send_header('Content-Encoding', 'zstd')
+        elif encoding == 'gzip':
+            body = entry['gz']
             self.send_header('Content-Encoding', 'gzip')
-            self.send_header('Content-Length', len(compressed))
-            self.end_headers()
-            self.wfile.write(compressed)
         else:
-            encoded = data.encode('utf-8')
-            self.send_header('Content-Length', len(encoded))
+            body = entry['raw']
+        self.send_header('Content-Length', len(body))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle_grid_var(self, name, filename):
+        """提供单个变量的二进制文件（坐标头 + little-endian 数组），支持按时间步 Range 请求"""
+        var, _, ext = filename.partition('.')
+        filepath = DATA_DIR / f'{name}_{var}.{ext}'
+        if ext not in GRID_VAR_EXTS or not var.isidentifier() or not filepath.is_file():
+            self.send_error(404, f'Grid variable not available: {name}/{filename}')
+            return
+        self._serve_file(filepath, f'{name}/{filename}')
+
+    def _serve_file(self, filepath, label):
+        """发送二进制数据文件: ETag 条件请求、单段 Range 请求、sendfile 零拷贝"""
+        st = filepath.stat()
+        # 强 ETag: 文件按字节原样发送（无内容编码），可用于 If-Range 的强比较
+        etag = f'"{st.st_size:x}-{st.st_mtime_ns:x}"'
+        if self._not_modified(etag):
+            return
+
+        byte_range = self._parse_range(st.st_size, etag)
+        if byte_range is False:
+            self.send_response(416)
+            self.send_header('Content-Range', f'bytes */{st.st_size}')
+            self.send_header('Content-Length', 0)
             self.end_headers()
-            self.wfile.write(encoded)
+            return
+
+        # 上限按实际响应长度判断: 前端按不超过该上限的 Range 分段获取大文件
+        start, end = byte_range or (0, st.st_size - 1)
+        if end - start + 1 > GRID_MAX_BYTES:
+            self.log_error('网格数据 %s 超出响应上限 (%d > %d 字节)', label, end - start + 1, GRID_MAX_BYTES)
+            self.send_error(503, f'Grid payload too large: {label}')
+            return
+
+        with open(filepath, 'rb') as f:
+            if byte_range:
+                self.send_response(206)
+                self.send_header('Content-Range', f'bytes {start}-{end}/{st.st_size}')
+            else:
+                self.send_response(200)
+            self.send_header('Content-Type', 'application/octet-stream')
+            self.send_header('Cache-Control', 'public, max-age=3600')
+            self.send_header('ETag', etag)
+            self.send_header('Accept-Ranges', 'bytes')
+            self.send_header('Content-Length', end - start + 1)
+            self.end_headers()
+            self._send_fd(f.fileno(), start, end - start + 1)
+
+    def _parse_range(self, size, etag):
+        """解析单段 Range 请求头
+
+        返回 (start, end) 闭区间；无 Range、多段或 If-Range 不匹配时返回 None
+        （按完整内容响应）；范围无法满足时返回 False。
+        """
+        header = self.headers.get('Range', '')
+        if not header.startswith('bytes=') or ',' in header:
+            return None
+        if_range = self.headers.get('If-Range')
+        if if_range is not None and if_range.strip() != etag:  # 强比较: 弱 ETag 永不匹配
+            return None
+
+        first, _, last = header[len('bytes='):].strip().partition('-')
+        try:
+            if first:
+                start = int(first)
+                end = min(int(last), size - 1) if last else size - 1
+            else:
+                start = max(size - int(last), 0)
+                end = size - 1
+        except ValueError:
+            return None
+        if start > end or start >= size:
+            return False
+        return start, end
+
+    def _send_fd(self, fd, offset, count):
+        """从文件描述符的 offset 处发送 count 字节: 优先 os.sendfile 内核零拷贝，不支持时 (Windows) mmap + write"""
+        if count <= 0:
+            return
+        if not hasattr(os, 'sendfile'):
+            with mmap.mmap(fd, offset + count, access=mmap.ACCESS_READ) as mm:
+                self.wfile.write(memoryview(mm)[offset:])
+            return
+        self.wfile.flush()
+        sock_fd = self.connection.fileno()
+        end = offset + count
+        while offset < end:
+            sent = os.sendfile(sock_fd, fd, offset, end - offset)
+            if sent == 0:
+                break
+            offset += sent
+
+    def _not_modified(self, etag):
+        """条件请求: If-None-Match 命中 ETag（弱比较，忽略 W/ 前缀）时回复 304 并返回 True"""
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match is None:
+            return False
+        tags = [_opaque_tag(t) for t in if_none_match.split(',')]
+        if '*' not in tags and _opaque_tag(etag) not in tags:
+            return False
+        self.send_response(304)
+        self.send_header('ETag', etag)
+        self.end_headers()
+        return True
 
-    def _json_response(self, data):
+    def _json_bytes_response(self, body):
+        """发送已序列化的 JSON 字节"""
         self.send_response(200)
         self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', len(body))
         self.end_headers()
-        self.wfile.write(json.dumps(data, ensure_ascii=False).encode('utf-8'))
+        self.wfile.write(body)
 
 
 if __name__ == '__main__':
     _preload_grids()
-    with http.server.HTTPServer(('', PORT), SimulationHandler) as httpd:
+    # 每个连接一个线程：慢客户端不会阻塞其他请求；网格缓存启动后只读，无需加锁
+    with http.server.ThreadingHTTPServer(('', PORT), SimulationHandler) as httpd:
         print(f'海上溢油预测仿真系统已启动: http://localhost:{PORT}')
         httpd.serve_forever()